@@ -6,9 +6,9 @@ from utils.generation import get_histograms
 from utils.generation import get_frequency
 from utils.generation import gen_power_curves
 from utils.generation import cumulate_power_frequencies
+from utils.generation import get_power_matrix
 from utils.generation import cumulate_power_time_series
-from utils.mapping import plot_power_curves_performance
-from utils.mapping import plot_power_curves_continuous
+from utils.mapping import plot_power_curves_all
 from utils.generation import optimal_rs_per_node
 from utils.mapping import plot_rated_speed_per_node
 
@@ -32,19 +32,23 @@ if __name__ == '__main__':
                                     delta_speed=0.025, swept_area=1.0, cp=0.37, water_density=1025)
     cumulated_power_frequencies = cumulate_power_frequencies(frequency=frequencies, power_curves=power_curves[2],
                                                              hourly_data_points=len(filtered_nodes))
-    plot_power_curves_performance(cumulated_power_frequencies)
 
-    # Time series cumulative approach. Compute the optimal rated speed and power generated for each node.
+    # Time series cumulative approach. The power per rated speed and node is shared by both post-processings.
+    power_matrix = get_power_matrix(min_rated_speed=0.6, max_rated_speed=3, filtered_nodes=filtered_nodes, delta=0.1,
+                                    density=1025, swept_area=1.0, cp=0.37)
     cumulated_power_time_series, capacity_factor = cumulate_power_time_series(min_rated_speed=0.6, max_rated_speed=3,
                                                                               filtered_nodes=filtered_nodes, delta=0.1,
-                                                                              density=1025, swept_area=1.0, cp=0.37)
+                                                                              density=1025, swept_area=1.0, cp=0.37,
+                                                                              power_matrix=power_matrix)
 
-    plot_power_curves_continuous(cumulated_power_time_series)
+    # Both cumulative power performances are plotted in a single figure.
+    plot_power_curves_all(cumulated_power_frequencies, cumulated_power_time_series)
 
     """
     # Compute the optimal rated speed for each node and the optimal power generated.
     optimal_rated_speeds = optimal_rs_per_node(min_rated_speed=0.6, max_rated_speed=3.0, filtered_nodes=filtered_nodes,
-                                               delta=0.1, density=1025, swept_area=1.0, cp=0.37)
+                                               delta=0.1, density=1025, swept_area=1.0, cp=0.37,
+                                               power_matrix=power_matrix)
     plot_rated_speed_per_node(optimal_rated_speeds=optimal_rated_speeds, selected_nodes=selected_nodes,
                               data=data_geo)
     """
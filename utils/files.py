@@ -1,3 +1,6 @@
+import os
+import tempfile
+
 import pandas as pd
 
 
@@ -12,11 +15,11 @@ def load_time_series_geo(path: str, tag_id: str, latitude_id: str, longitude_id:
     :param longitude_id: Column name for the longitude.
     :return: A pandas DataFrame with the selected time series.
     """
-    raw_data = pd.read_csv(path, header=0)
-    selected_data = pd.DataFrame()
-    selected_data['tag'] = raw_data[tag_id]
-    selected_data['latitude'] = raw_data[latitude_id]
-    selected_data['longitude'] = raw_data[longitude_id]
+    # Only the three required columns are parsed from the file (one row per node).
+    raw_data = pd.read_csv(path, header=0, usecols=[tag_id, latitude_id, longitude_id],
+                           dtype={tag_id: 'string', latitude_id: 'float32', longitude_id: 'float32'})
+    selected_data = raw_data.rename(columns={tag_id: 'tag', latitude_id: 'latitude', longitude_id: 'longitude'})
+    selected_data = selected_data[['tag', 'latitude', 'longitude']]
 
     return selected_data
 
@@ -30,7 +33,56 @@ def filter_time_series_data(path: str, index_id: str, nodes: list):
     :param nodes: List with the selected nodes from the geographical map.
     :return: filtered_data: A pandas DataFrame with the filtered time series data.
     """
-    raw_data = pd.read_csv(path, header=0, index_col=index_id)
-    raw_data.index = pd.to_datetime(raw_data.index)
+    parquet_path = _parquet_path(path)
+    if _is_cache_valid(path, parquet_path):
+        # Only the selected nodes (and the index) are read from the columnar mirror of the csv file.
+        raw_data = pd.read_parquet(parquet_path, columns=list(nodes))
+    else:
+        # The whole csv file is parsed once to build the mirror, later runs read any node selection from it.
+        raw_data = pd.read_csv(path, header=0, index_col=index_id, engine='pyarrow', dtype={index_id: 'datetime64[ns]'})
+        _write_cache(raw_data, parquet_path)
     filtered_data = raw_data[nodes]
     return filtered_data
+
+
+def _parquet_path(path: str):
+    """
+    Function that returns the path of the parquet mirror of a csv file.
+
+    :param path: Path to the csv file.
+    :return: Path to the parquet file next to the csv file.
+    """
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+def _write_cache(data: pd.DataFrame, parquet_path: str):
+    """
+    Function that writes the parquet mirror of a csv file. The mirror is only a cache, so it is written to a temporary
+    file that replaces the mirror once complete, and failing to write it does not stop the analysis.
+
+    :param data: Pandas DataFrame with the csv file data.
+    :param parquet_path: Path to the parquet file.
+    :return: None
+    """
+    temporary_path = None
+    try:
+        file_descriptor, temporary_path = tempfile.mkstemp(suffix='.parquet', dir=os.path.dirname(parquet_path) or '.')
+        os.close(file_descriptor)
+        data.to_parquet(temporary_path)
+        os.replace(temporary_path, parquet_path)
+    except OSError as error:
+        print("The parquet cache could not be written:", error)
+        if temporary_path is not None and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return
+
+
+def _is_cache_valid(path: str, parquet_path: str):
+    """
+    Function that checks if the parquet mirror of a csv file exists and is not older than the csv file.
+
+    :param path: Path to the csv file.
+    :param parquet_path: Path to the parquet file.
+    :return: True if the parquet file can be read instead of the csv file.
+    """
+    return os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(path)
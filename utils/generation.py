@@ -1,6 +1,10 @@
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
+from joblib import Parallel, delayed
+from numba import njit, prange
+
+# Number of rated speeds above which sorting the velocities once is cheaper than a pass over them per rated speed.
+SORTED_MIN_RATED_SPEEDS = 100
 
 
 def get_histograms(data: pd.DataFrame, bin_size: float = 0.1, max_velocity: float = 2.8):
@@ -13,10 +17,8 @@ def get_histograms(data: pd.DataFrame, bin_size: float = 0.1, max_velocity: floa
     :return: Number of records in each bin for each node.
     """
     bins = np.arange(0, max_velocity + bin_size, bin_size)
-    histograms = {}
-    for node in data.columns:
-        histograms[node] = np.histogram(data[node], bins=bins)[0]
-    histograms = pd.DataFrame(histograms)
+    velocities = _node_major(data)
+    histograms = pd.DataFrame(_histograms_numba(velocities, bins), columns=data.columns)
     histograms.index = bins[1:]
     return histograms
 
@@ -50,19 +52,13 @@ def gen_power_curves(frequencies: pd.DataFrame, min_ci_speed: float, min_rate_pc
     maximum_co_vector = minimum_ci_vector * (100 / min_rate_pct)
     maximum_co_vector = np.round(maximum_co_vector / delta_speed) * delta_speed
 
-    velocities = list(frequencies.index)
-    power_curves = []
-    for i in range(len(minimum_ci_vector)):
-        power_curve = []
-        for velocity in velocities:
-            if velocity < minimum_ci_vector[i]:
-                power_curve.append(0)
-            elif minimum_ci_vector[i] <= velocity < maximum_co_vector[i]:
-                power_curve.append(0.5 * cp * swept_area * water_density * (velocity ** 3))
-            else:
-                power_curve.append(0.5 * cp * swept_area * water_density * (maximum_co_vector[i] ** 3))
-        power_curves.append(power_curve)
-    power_curves = np.array(power_curves).T
+    # Broadcast velocities (rows) against the cut-in/cut-out limits (columns) of every power curve.
+    velocities = np.asarray(frequencies.index, dtype=np.float64)[:, None]
+    cut_in = minimum_ci_vector[None, :]
+    cut_out = maximum_co_vector[None, :]
+    effective_velocities = np.where(velocities < cut_in, 0.0, np.minimum(velocities, cut_out))
+    power_factor = 0.5 * cp * swept_area * water_density
+    power_curves = power_factor * effective_velocities * effective_velocities * effective_velocities
     return minimum_ci_vector, maximum_co_vector, power_curves
 
 
@@ -75,21 +71,44 @@ def cumulate_power_frequencies(frequency: pd.DataFrame, power_curves: np.array,
     :param hourly_data_points: Number of hourly data points.
     :return: Cumulated power generated by the water turbine for each node.
     """
+    # Summing the frequencies over the nodes first turns the double loop into a single vector-matrix product.
+    total_frequency = frequency.to_numpy(dtype=np.float64).sum(axis=1) * hourly_data_points
+    cumulated_power = total_frequency @ power_curves
+    return cumulated_power
 
-    cumulated_power = []
-    frequency = frequency * hourly_data_points
 
-    for curve in power_curves.T:
-        power = 0
-        for node in frequency.columns:
-            power += np.sum(frequency[node] * curve)
-        cumulated_power.append(power)
-    cumulated_power = np.array(cumulated_power)
-    return cumulated_power
+def get_power_matrix(min_rated_speed: float, max_rated_speed: float, filtered_nodes: pd.DataFrame, delta: float = 0.01,
+                     density: float = 1025, swept_area: float = 0.7854, cp: float = 0.37):
+    """
+    Function that computes the power generated over the time series for each rated speed applied to each node. The
+    result can be shared by cumulate_power_time_series and optimal_rs_per_node to avoid computing it twice.
+    :param min_rated_speed: Minimum rated speed for the water turbine in m/s.
+    :param max_rated_speed: Maximum rated speed for the water turbine in m/s.
+    :param filtered_nodes: Filtered time series data set.
+    :param delta: Incremental value for the rated speed.
+    :param density: Density of the water in kg/m^3 (non-standard).
+    :param swept_area: Swept area of the water turbine in m^2.
+    :param cp: Coefficient of performance for the water turbine.
+    :return: power_matrix: Array with the cumulated power, shape (rated speeds, nodes).
+    """
+    rated_speed_vector = np.arange(min_rated_speed, max_rated_speed + delta, delta)
+    velocities = _node_major(filtered_nodes)
+    power_factor = 0.5 * cp * swept_area * density
+    if len(rated_speed_vector) > SORTED_MIN_RATED_SPEEDS:
+        return _cumulate_sorted(velocities, rated_speed_vector, power_factor)
+    # Nodes are independent, the kernel releases the GIL so the nodes are dispatched to a pool of threads.
+    power_per_node = Parallel(n_jobs=-1, backend='threading')(
+        delayed(_cumulate_node_numba)(velocity, rated_speed_vector, power_factor) for velocity in velocities)
+    # Preallocated so an empty node selection gives an empty (rated speeds, 0) matrix.
+    power_matrix = np.empty((len(rated_speed_vector), velocities.shape[0]))
+    for j, power_per_rs in enumerate(power_per_node):
+        power_matrix[:, j] = power_per_rs
+    return power_matrix
 
 
 def cumulate_power_time_series(min_rated_speed: float, max_rated_speed: float, filtered_nodes: pd.DataFrame, delta: float = 0.01,
-                               density: float = 1025, swept_area: float = 0.7854, cp: float = 0.37):
+                               density: float = 1025, swept_area: float = 0.7854, cp: float = 0.37,
+                               power_matrix: np.ndarray = None):
     """
     Function that cumulates the power generated by the water turbine for each power curve applied to each node. The cumulative energy
     is computed for a time series data set instead of a frequency data set.
@@ -100,37 +119,23 @@ def cumulate_power_time_series(min_rated_speed: float, max_rated_speed: float, f
     :param density: Density of the water in kg/m^3 (non-standard).
     :param swept_area: Swept area of the water turbine in m^2.
     :param cp: Coefficient of performance for the water turbine.
+    :param power_matrix: Precomputed output of get_power_matrix for the same arguments. Computed if not given.
     :return:
     """
     rated_speed_vector = np.arange(min_rated_speed, max_rated_speed + delta, delta)
-    cumulated_power = []
-    ideal_cumulated_power = []
-    for rated_speed in tqdm(rated_speed_vector):
-        power_per_node = []
-        ideal_power_per_node = []
-        for node in filtered_nodes.columns:
-            power = 0
-            ideal_power = 0
-            for i in range(len(filtered_nodes)):
-                if filtered_nodes[node][i] < (rated_speed * 0.3):
-                    power += 0
-                elif (rated_speed * 0.3) <= filtered_nodes[node][i] < rated_speed:
-                    power += 0.5 * cp * swept_area * density * (filtered_nodes[node][i] ** 3)
-                else:
-                    power += 0.5 * cp * swept_area * density * (rated_speed ** 3)
-                ideal_power += 0.5 * cp * swept_area * density * (rated_speed ** 3)
-            power_per_node.append(power)
-            ideal_power_per_node.append(ideal_power)
-        cumulated_power.append(np.sum(power_per_node))
-        ideal_cumulated_power.append(np.sum(ideal_power_per_node))
-    cumulated_power = np.array(cumulated_power)
-    ideal_cumulated_power = np.array(ideal_cumulated_power)
+    if power_matrix is None:
+        power_matrix = get_power_matrix(min_rated_speed, max_rated_speed, filtered_nodes, delta, density, swept_area, cp)
+    power_factor = 0.5 * cp * swept_area * density
+    cumulated_power = power_matrix.sum(axis=1)
+    rated_speed_cube = rated_speed_vector * rated_speed_vector * rated_speed_vector
+    ideal_cumulated_power = power_factor * rated_speed_cube * filtered_nodes.size
     capacity_factor = cumulated_power / ideal_cumulated_power
     return cumulated_power, capacity_factor
 
 
 def optimal_rs_per_node(min_rated_speed: float, max_rated_speed: float, filtered_nodes: pd.DataFrame, delta: float = 0.01,
-                        density: float = 1025, swept_area: float = 0.7854, cp: float = 0.37):
+                        density: float = 1025, swept_area: float = 0.7854, cp: float = 0.37,
+                        power_matrix: np.ndarray = None):
     """
     Function that computes the optimal rated speed for the power generation of each node.
     :param min_rated_speed: Minimum rated speed for the water turbine in m/s.
@@ -140,25 +145,99 @@ def optimal_rs_per_node(min_rated_speed: float, max_rated_speed: float, filtered
     :param density: Density of the water in kg/m^3 (non-standard).
     :param swept_area: Swept area of the water turbine in m^2.
     :param cp: Coefficient of performance for the water turbine.
+    :param power_matrix: Precomputed output of get_power_matrix for the same arguments. Computed if not given.
     :return: optimal_rs: Array with the optimal rated speed for each node.
     """
     rated_speed_vector = np.arange(min_rated_speed, max_rated_speed + delta, delta)
-    optimal_rs = []  # List with the optimal rated speed computed for each node. The length of the list is equal to the number of nodes.
-    optimal_power = []  # List with the optimal power computed for each node. The length of the list is equal to the number of nodes.
-    for node in tqdm(filtered_nodes.columns):
-        power_per_rs = []
-        for rated_speed in tqdm(rated_speed_vector):
-            power = 0
-            for i in range(len(filtered_nodes)):
-                if filtered_nodes[node][i] < (rated_speed * 0.3):
-                    power += 0
-                elif (rated_speed * 0.3) <= filtered_nodes[node][i] < rated_speed:
-                    power += 0.5 * cp * swept_area * density * (filtered_nodes[node][i] ** 3)
-                else:
-                    power += 0.5 * cp * swept_area * density * (rated_speed ** 3)
-            power_per_rs.append(power)
-        power_per_rs = np.array(power_per_rs)
-        optimal_power.append(np.max(power_per_rs))
-        optimal_rs.append(rated_speed_vector[np.argmax(power_per_rs)])
+    if power_matrix is None:
+        power_matrix = get_power_matrix(min_rated_speed, max_rated_speed, filtered_nodes, delta, density, swept_area, cp)
+    optimal_rs = list(rated_speed_vector[np.argmax(power_matrix, axis=0)])  # Optimal rated speed for each node.
+    optimal_power = list(np.max(power_matrix, axis=0))  # Optimal power for each node.
 
     return optimal_rs, optimal_power
+
+
+def _node_major(data: pd.DataFrame):
+    """
+    Function that converts the time series data to a C-contiguous array with the node index as the major axis, so the
+    kernels read each node time series sequentially.
+    :param data: Dataframe with the time series data, one column per node.
+    :return: Array with the time series data, shape (nodes, time samples).
+    """
+    return np.ascontiguousarray(data.to_numpy(dtype=np.float64).T)
+
+
+def _cumulate_sorted(velocities: np.ndarray, rated_speed_vector: np.ndarray, power_factor: float):
+    """
+    Function that cumulates the power generated over the time series for each rated speed and node from the sorted
+    velocities. The power only changes at the cut-in and rated speed cut-points, so each rated speed reduces to two
+    binary searches and a difference of prefix sums of the cubed velocities.
+    :param velocities: Array with the time series velocities, shape (nodes, time samples).
+    :param rated_speed_vector: Array with the rated speeds for the water turbine in m/s.
+    :param power_factor: Power factor of the water turbine (0.5 * cp * swept area * density).
+    :return: Array with the cumulated power, shape (rated speeds, nodes).
+    """
+    n_nodes, n_samples = velocities.shape
+    sorted_velocities = np.sort(velocities, axis=1)
+    cube_prefix = np.zeros((n_nodes, n_samples + 1))
+    np.cumsum(sorted_velocities * sorted_velocities * sorted_velocities, axis=1, out=cube_prefix[:, 1:])
+    rated_speed_cube = rated_speed_vector * rated_speed_vector * rated_speed_vector
+    power_matrix = np.empty((len(rated_speed_vector), n_nodes))
+    for j in range(n_nodes):
+        # Samples in [low, high) are between the cut-in and the rated speed, samples from high on are capped.
+        low = np.searchsorted(sorted_velocities[j], rated_speed_vector * 0.3)
+        high = np.searchsorted(sorted_velocities[j], rated_speed_vector)
+        power_matrix[:, j] = cube_prefix[j, high] - cube_prefix[j, low] + (n_samples - high) * rated_speed_cube
+    return power_factor * power_matrix
+
+
+@njit(nogil=True, fastmath={'reassoc', 'contract', 'arcp', 'nsz', 'afn'}, cache=True)
+def _cumulate_node_numba(velocity: np.ndarray, rated_speed_vector: np.ndarray, power_factor: float):
+    """
+    Numba kernel that cumulates the power generated over the time series of a node for each rated speed.
+    :param velocity: Array with the time series velocities of the node.
+    :param rated_speed_vector: Array with the rated speeds for the water turbine in m/s.
+    :param power_factor: Power factor of the water turbine (0.5 * cp * swept area * density).
+    :return: Array with the cumulated power for each rated speed.
+    """
+    power_per_rs = np.zeros(len(rated_speed_vector))
+    for k in range(len(rated_speed_vector)):
+        rated_speed = rated_speed_vector[k]
+        cut_in_speed = rated_speed * 0.3
+        # Cubed velocities are accumulated and scaled by the power factor once per rated speed. The loop body is
+        # branch-free (capping and cut-in as selects) so LLVM vectorizes the clip, cube and sum in one pass. The
+        # fastmath flags allow reordering the sum but keep NaN semantics: the comparisons are negated so a NaN
+        # velocity is capped to the rated speed, as in the sorted path where NaN sorts above every rated speed.
+        power = 0.0
+        for i in range(len(velocity)):
+            capped_velocity = velocity[i] if velocity[i] < rated_speed else rated_speed
+            power += 0.0 if velocity[i] < cut_in_speed else capped_velocity * capped_velocity * capped_velocity
+        power_per_rs[k] = power_factor * power
+    return power_per_rs
+
+
+@njit(parallel=True, cache=True)
+def _histograms_numba(velocities: np.ndarray, bins: np.ndarray):
+    """
+    Numba kernel that counts the number of records in each uniform bin for each node in a single pass.
+    :param velocities: Array with the time series velocities, shape (nodes, time samples).
+    :param bins: Array with the uniformly spaced bin edges.
+    :return: Array with the number of records, shape (bins, nodes).
+    """
+    n_nodes, n_samples = velocities.shape
+    n_bins = len(bins) - 1
+    scale = n_bins / (bins[-1] - bins[0])
+    counts = np.zeros((n_bins, n_nodes), dtype=np.int64)
+    for j in prange(n_nodes):
+        for i in range(n_samples):
+            velocity = velocities[j, i]
+            if not (bins[0] <= velocity <= bins[-1]):
+                continue
+            # Scale the velocity to its bin index and correct the rounding against the bin edges (as np.histogram).
+            index = min(int((velocity - bins[0]) * scale), n_bins - 1)
+            if velocity < bins[index]:
+                index -= 1
+            elif index != n_bins - 1 and velocity >= bins[index + 1]:
+                index += 1
+            counts[index, j] += 1
+    return counts
@@ -1,23 +1,71 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Patch
+from scipy.spatial import cKDTree
 
+# PNG encoder settings for the saved figures: a lower zlib level encodes much faster for a slightly larger file.
+PNG_KWARGS = {'compress_level': 3, 'optimize': False}
 
-def selection_node(data: pd.DataFrame):
+# Layout, grid and minor ticks styling shared by every figure, set once at import instead of per plot.
+plt.rcParams.update({'figure.constrained_layout.use': True, 'axes.grid': True, 'axes.grid.which': 'both',
+                     'grid.linestyle': '-', 'grid.linewidth': 0.5, 'grid.color': 'black', 'grid.alpha': 0.15,
+                     'xtick.minor.visible': True, 'ytick.minor.visible': True})
+
+
+def selection_node(data: pd.DataFrame, backend: str = 'matplotlib', show: bool = True):
     """
     Function that allows the user to select nodes from a geographical map.
     The user can click on the nodes to select them. The selected nodes will
     be highlighted in red.
 
     :param data: Pandas DataFrame with the nodes data preprocessed.
+    :param backend: Rendering backend, 'matplotlib' or 'gpu' (fastplotlib, for very large node sets).
+    :param show: Indicates if the plot is displayed for the selection, otherwise it is only saved.
     :return: list with the selected nodes tags.
     """
-    # Create a scatter plot with the nodes.
+    if backend == 'gpu' and show:
+        try:
+            import fastplotlib as fpl
+        except ImportError:
+            print("fastplotlib is not installed, using the matplotlib backend.")
+        else:
+            return _selection_node_gpu(data, fpl)
+
+    # Nodes data as arrays, extracted once from the DataFrame.
+    tags = data['tag'].to_numpy()
+    longitude = data['longitude'].to_numpy()
+    latitude = data['latitude'].to_numpy()
+
+    # Plot the nodes as a single line of markers, with a scatter on top holding only the selected nodes.
     fig, ax = plt.subplots()
-    sc = ax.scatter(data['longitude'], data['latitude'], c='YellowGreen', s=75)
+    marker_size = 75
+    ax.plot(longitude, latitude, 'o', markersize=np.sqrt(marker_size), markerfacecolor='YellowGreen',
+            markeredgecolor='YellowGreen', markeredgewidth=1.0, rasterized=True)
+    sc = ax.scatter([], [], c='IndianRed', s=marker_size, zorder=3, rasterized=True)
+
+    # Spatial index of the nodes positions and marker radius in pixels, to find the clicked node.
+    tree = cKDTree(np.column_stack((longitude, latitude)))
+    marker_radius = np.sqrt(marker_size) / 2 * fig.dpi / 72
 
-    # Create a list to store the selected nodes.
-    selected_nodes = []
+    # Sorted indices of the selected nodes.
+    selected_indices = np.empty(0, dtype=np.int64)
+
+    # The selected nodes scatter is animated so the background can be saved after each full draw and restored on click.
+    sc.set_animated(True)
+    background = None
+
+    def on_draw(event):
+        """
+        Function that saves the axes background and draws the scatter on top after a full draw.
+        :param event: Draw event.
+        :return: None
+        """
+        nonlocal background
+        background = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(sc)
 
     # Create a function to handle the click event on the plot.
     def on_click(event):
@@ -26,160 +74,303 @@ def selection_node(data: pd.DataFrame):
         :param event: Click event.
         :return: None
         """
-        # Indentify the nearest node to the click event
-        ind = sc.contains(event)[1]["ind"]
-        if len(ind):
-            node_index = ind[0]
-            node = data.iloc[node_index]['tag']
-            # Check if the node is already selected
-            if node in selected_nodes:
-                selected_nodes.remove(node)
-                # Change color to indicate deselection
-                sc.set_facecolor(['YellowGreen' if data.iloc[i]['tag'] not in selected_nodes else 'IndianRed' for i in range(len(data))])
+        nonlocal selected_indices
+        # Indentify the nearest node to the click event, ignoring clicks outside of its marker
+        if event.inaxes is not ax:
+            return
+        node_index = tree.query([event.xdata, event.ydata])[1]
+        node_position = ax.transData.transform(tree.data[node_index])
+        if np.hypot(node_position[0] - event.x, node_position[1] - event.y) <= marker_radius:
+            # Toggle the node selection, keeping the indices sorted, and only update the selected nodes positions
+            position = np.searchsorted(selected_indices, node_index)
+            if position < selected_indices.size and selected_indices[position] == node_index:
+                selected_indices = np.delete(selected_indices, position)
             else:
-                selected_nodes.append(node)
-                # Change color to indicate selection
-                sc.set_facecolor(['YellowGreen' if data.iloc[i]['tag'] not in selected_nodes else 'IndianRed' for i in range(len(data))])
-            # Update the plot
-            plt.draw()
+                selected_indices = np.insert(selected_indices, position, node_index)
+            sc.set_offsets(tree.data[selected_indices])
+            # Only redraw the scatter over the saved background, or request a full redraw if it is not available
+            if background is None:
+                fig.canvas.draw_idle()
+            else:
+                fig.canvas.restore_region(background)
+                ax.draw_artist(sc)
+                fig.canvas.blit(ax.bbox)
 
-    # Connect the click event to the plot
-    fig.canvas.mpl_connect('button_press_event', on_click)
+    # Connect the draw and click events to the plot, only when it is displayed
+    if show and fig.canvas.supports_blit:
+        fig.canvas.mpl_connect('draw_event', on_draw)
+    else:
+        sc.set_animated(False)
+    if show:
+        fig.canvas.mpl_connect('button_press_event', on_click)
 
     # Display the plot with the nodes
     plt.xlabel('Longitude [°]')
     plt.ylabel('Latitude [°]')
     plt.title('Node Selection')
-    plt.minorticks_on()
-    plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-    plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-    plt.show(block=True)
+    _style(ax)
+    if show:
+        plt.show(block=True)
+        sc.set_animated(False)
+
+    # Save the plot as an image. The bounding box is explicitly the whole figure so the figure is rendered only once.
+    fig.canvas.print_figure('Node_Selection.png', dpi=300, bbox_inches=None, pil_kwargs=PNG_KWARGS)
+    if not show:
+        plt.close(fig)
+
+    # Print the selected nodes tag and number
+    selected_nodes = tags[selected_indices].tolist()
+    print("Number of selected nodes:", len(selected_nodes))
+    print("Selected nodes:", selected_nodes)
+
+    return selected_nodes
+
 
-    # Save the plot as an image
-    fig.savefig('Node_Selection.png', dpi=300)
+def _selection_node_gpu(data: pd.DataFrame, fpl):
+    """
+    Function that allows the user to select nodes from a geographical map rendered on the GPU with fastplotlib.
+    Selecting a node only uploads the color of the clicked point to the GPU.
+
+    :param data: Pandas DataFrame with the nodes data preprocessed.
+    :param fpl: The fastplotlib module.
+    :return: list with the selected nodes tags.
+    """
+    tags = data['tag'].to_numpy()
+    positions = np.column_stack((data['longitude'].to_numpy(), data['latitude'].to_numpy())).astype(np.float32)
+    unselected_color = mcolors.to_rgba('YellowGreen')
+    selected_color = mcolors.to_rgba('IndianRed')
+    selected_indices = np.empty(0, dtype=np.int64)
+
+    # Create a scatter plot with the nodes.
+    figure = fpl.Figure()
+    scatter = figure[0, 0].add_scatter(data=positions, colors=np.tile(unselected_color, (len(data), 1)), sizes=10)
+
+    def on_click(event):
+        """
+        Function that handles the click event on the scatter.
+        :param event: Pointer event with the picked node.
+        :return: None
+        """
+        nonlocal selected_indices
+        node_index = event.pick_info["vertex_index"]
+        # Toggle the node selection, keeping the indices sorted, and only update the color of the clicked node
+        position = np.searchsorted(selected_indices, node_index)
+        if position < selected_indices.size and selected_indices[position] == node_index:
+            selected_indices = np.delete(selected_indices, position)
+            scatter.colors[node_index] = unselected_color
+        else:
+            selected_indices = np.insert(selected_indices, position, node_index)
+            scatter.colors[node_index] = selected_color
+
+    scatter.add_event_handler(on_click, "click")
+
+    # Display the plot with the nodes until the window is closed
+    figure.show()
+    fpl.loop.run()
 
     # Print the selected nodes tag and number
+    selected_nodes = tags[selected_indices].tolist()
     print("Number of selected nodes:", len(selected_nodes))
     print("Selected nodes:", selected_nodes)
 
     return selected_nodes
 
 
-def plot_histograms(data: pd.DataFrame, relative: bool = True):
+def plot_histograms(data: pd.DataFrame, relative: bool = True, show: bool = True):
     """
     Function that plots histograms for a given data set.
 
     :param relative: Indicates if the histograms should be plotted as relative values.
     :param data: Dataframe with the data to generate the histograms.
+    :param show: Indicates if the plot is displayed, otherwise it is only saved.
     :return: Plot of the histograms.
     """
     if relative is True:
         fig, ax = plt.subplots()
         # Plot as a graph bar the histograms for each node
-        for node in data.columns:
-            ax.hist(data.index, bins=data.index, weights=data[node], alpha=0.7, label=node)
-        ax.legend()
+        _bar_collection(ax, data)
         plt.xlabel('Velocidad [m/s]')
         plt.ylabel('Frecuencia relativa')
         plt.title('Histogramas de velocidad')
-        plt.minorticks_on()
-        plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-        plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-        plt.savefig('Velocity_Histograms_Relative_Frequency.png', dpi=300)
-        plt.show(block=True)
+        _style(ax)
+        plt.savefig('Velocity_Histograms_Relative_Frequency.png', dpi=300, pil_kwargs=PNG_KWARGS)
+        _show(fig, show)
     else:
         fig, ax = plt.subplots()
         # Plot as a graph bar the histograms for each node
-        for node in data.columns:
-            ax.bar(data.index, data[node], alpha=0.7, label=node)
-        ax.legend()
+        _bar_collection(ax, data)
         plt.xlabel('Velocity [m/s]')
         plt.ylabel('Number of records')
         plt.title('Velocity Histograms')
-        plt.minorticks_on()
-        plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-        plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-        plt.savefig('Velocity_Histograms_Number_of_Records.png', dpi=300)
-        plt.show(block=True)
+        _style(ax)
+        plt.savefig('Velocity_Histograms_Number_of_Records.png', dpi=300, pil_kwargs=PNG_KWARGS)
+        _show(fig, show)
     return
 
 
-def plot_power_curves_performance(cumulated_power: np.array):
+def plot_power_curves_performance(cumulated_power: np.array, show: bool = True):
     """
     Function that plots the cumulative power performance for the power curves.
     :param cumulated_power: cumulative power performance for the power curves.
+    :param show: Indicates if the plot is displayed, otherwise it is only saved.
     :return: bar plot with the cumulative power performance for each power curve.
     """
-    x = np.arange(1, len(cumulated_power) + 1, 1)
-    y = cumulated_power
-
-    # Bar plot of the cumulative power performance curve. Maximum power is highlighted in red.
     fig, ax = plt.subplots()
-    ax.bar(x, y, color='YellowGreen')
-    ax.bar(np.argmax(y) + 1, y[np.argmax(y)], color='IndianRed')
-    plt.xlabel('Power Curve')
-    plt.ylabel('Cumulative Power [Wh]')
-    plt.title('Cumulative Power Performance')
-    plt.minorticks_on()
-    plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-    plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-    plt.savefig('Frequency_Cumulative_Power_Performance.png', dpi=300)
-    plt.show(block=True)
+    _power_curves_performance(ax, cumulated_power)
+    plt.savefig('Frequency_Cumulative_Power_Performance.png', dpi=300, pil_kwargs=PNG_KWARGS)
+    _show(fig, show)
     return
 
 
-def plot_power_curves_continuous(cumulated_power: np.array):
+def plot_power_curves_continuous(cumulated_power: np.array, show: bool = True):
     """
     Function that plots the cumulative power performance for the power curves.
     :param cumulated_power: cumulative power performance for the power curves.
+    :param show: Indicates if the plot is displayed, otherwise it is only saved.
     :return: bar plot with the cumulative power performance for each power curve.
     """
-    plt.plot( np.arange(0.6, 3.1, 0.1), cumulated_power/5, marker='o', color='YellowGreen', markersize=10)
-    plt.xlabel('Velocidad nominal [m/s]')
-    plt.ylabel('Potencia acumulada [Wh/año]')
-    plt.title('Potencial energético')
-    plt.minorticks_on()
-    plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-    plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-    plt.savefig('Time_Series_Cumulative_Power_Performance.png', dpi=300)
-    plt.show(block=True)
+    fig, ax = plt.subplots()
+    _power_curves_continuous(ax, cumulated_power)
+    plt.savefig('Time_Series_Cumulative_Power_Performance.png', dpi=300, pil_kwargs=PNG_KWARGS)
+    _show(fig, show)
     return
 
 
-def plot_rated_speed_per_node(optimal_rated_speeds: tuple, selected_nodes: list, data: pd.DataFrame):
+def plot_power_curves_all(cumulated_power_bar: np.array, cumulated_power_continuous: np.array, show: bool = True):
+    """
+    Function that plots the cumulative power performance of the frequency and time series approaches side by side,
+    saving both in a single image.
+    :param cumulated_power_bar: cumulative power performance for the power curves from the frequencies.
+    :param cumulated_power_continuous: cumulative power performance for the rated speeds from the time series.
+    :param show: Indicates if the plot is displayed, otherwise it is only saved.
+    :return: None
+    """
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12.8, 4.8))
+    _power_curves_performance(ax1, cumulated_power_bar)
+    _power_curves_continuous(ax2, cumulated_power_continuous)
+    fig.savefig('Power_Performance_All.png', dpi=300, pil_kwargs=PNG_KWARGS)
+    _show(fig, show)
+    return
+
+
+def plot_rated_speed_per_node(optimal_rated_speeds: tuple, selected_nodes: list, data: pd.DataFrame,
+                              show: bool = True):
     """
     Function that plots the optimal rated speed for each node.
     :param optimal_rated_speeds: Tuple with the optimal rated speed for each node.
     :param selected_nodes: List with the selected nodes.
     :param data: Data with the geographical information.
+    :param show: Indicates if the plot is displayed, otherwise it is only saved.
     :return: None
     """
-    # Filter the data based on the nodes list.
-    plot_data = data[data['tag'].isin(selected_nodes)].copy()
-    plot_data['optimal_rated_speed'] = optimal_rated_speeds[0]
-    plot_data['optimal_power'] = optimal_rated_speeds[1]
+    # Positions of the selected nodes, in the order of the selection (which is the order of the optimal values).
+    tag_to_index = {tag: i for i, tag in enumerate(data['tag'].to_numpy())}
+    indices = np.array([tag_to_index[node] for node in selected_nodes], dtype=np.intp)
+    longitude = data['longitude'].to_numpy()[indices]
+    latitude = data['latitude'].to_numpy()[indices]
+    optimal_rated_speed = np.asarray(optimal_rated_speeds[0])
+    optimal_power = np.asarray(optimal_rated_speeds[1])
 
-    # Create a scatter plot colored by the optimal rated speed.
-    plt.scatter(plot_data['longitude'], plot_data['latitude'], c=plot_data['optimal_rated_speed'], cmap='viridis', s=100)
-    plt.xlabel('Longitude [°]')
-    plt.ylabel('Latitude [°]')
-    plt.title('Optimal Rated Speed per Node')
-    plt.colorbar().set_label('Rated Speed [m/s]')
-    plt.minorticks_on()
-    plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-    plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-    plt.savefig('Optimal_Rated_Speed_per_Node.png', dpi=300)
-    plt.show(block=True)
-
-    # Create a scatter plot colored by the optimal power.
-    plt.scatter(plot_data['longitude'], plot_data['latitude'], c=plot_data['optimal_power']/5, cmap='viridis', s=100)
-    plt.xlabel('Longitude [°]')
-    plt.ylabel('Latitude [°]')
-    plt.title('Optimal Power per Node')
-    plt.colorbar().set_label('Power [Wh/m^2 yr]')
-    plt.minorticks_on()
-    plt.grid(which='major', linestyle='-', linewidth='0.5', color='black', alpha=0.15)
-    plt.grid(which='minor', linestyle='-', linewidth='0.5', color='black', alpha=0.10)
-    plt.savefig('Optimal_Power_per_Node.png', dpi=300)
-    plt.show(block=True)
+    # Create two scatter plots sharing the nodes positions, colored by the optimal rated speed and power.
+    fig, axes = plt.subplots(1, 2, sharex=True, sharey=True, figsize=(12.8, 4.8))
+    for ax, values, title, label in ((axes[0], optimal_rated_speed, 'Optimal Rated Speed per Node', 'Rated Speed [m/s]'),
+                                     (axes[1], optimal_power/5, 'Optimal Power per Node', 'Power [Wh/m^2 yr]')):
+        sc = ax.scatter(longitude, latitude, c=values, cmap='viridis', s=100, rasterized=True)
+        ax.set_xlabel('Longitude [°]')
+        ax.set_ylabel('Latitude [°]')
+        ax.set_title(title)
+        fig.colorbar(sc, ax=ax).set_label(label)
+        _style(ax)
+    fig.savefig('Optimal_Rated_Speed_and_Power.png', dpi=300, pil_kwargs=PNG_KWARGS)
+    _show(fig, show)
+    return
+
+
+def _bar_collection(ax: plt.Axes, data: pd.DataFrame):
+    """
+    Function that draws the bars of already binned data for every node as a single collection, with the placement
+    of a histogram of the bins, and adds the legend of the nodes.
+    :param ax: Axes where the bars are drawn.
+    :param data: Dataframe with the binned data, bins as index and one column per node.
+    :return: None
+    """
+    left = data.index.to_numpy(dtype=np.float64)
+    width = np.diff(left).mean() if len(left) > 1 else 1.0
+    heights = data.to_numpy(dtype=np.float64).T
+    n_nodes, n_bins = heights.shape
+
+    # Rectangle vertices of every bar, shape (nodes, bins, corners, xy).
+    vertices = np.zeros((n_nodes, n_bins, 4, 2))
+    vertices[..., 0] = left[None, :, None] + np.array([0, 0, width, width])
+    vertices[:, :, 1, 1] = heights
+    vertices[:, :, 2, 1] = heights
+
+    # One color of the property cycle per node, as consecutive bar calls would use.
+    cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    colors = mcolors.to_rgba_array([cycle[j % len(cycle)] for j in range(n_nodes)])
+    ax.add_collection(PolyCollection(vertices.reshape(-1, 4, 2), facecolors=np.repeat(colors, n_bins, axis=0),
+                                     edgecolors='none', alpha=0.7))
+    ax.autoscale_view()
+    ax.set_ylim(bottom=0)
+    ax.legend(handles=[Patch(facecolor=color, alpha=0.7, label=node) for color, node in zip(colors, data.columns)])
+
+
+def _power_curves_performance(ax: plt.Axes, cumulated_power: np.array):
+    """
+    Function that draws the cumulative power performance of each power curve as bars, highlighting the maximum in red.
+    :param ax: Axes where the bars are drawn.
+    :param cumulated_power: cumulative power performance for the power curves.
+    :return: None
+    """
+    # Contiguous float32 copy of the values, enough precision for plotting.
+    y = np.ascontiguousarray(cumulated_power, dtype=np.float32)
+    x = np.arange(1, y.shape[0] + 1, dtype=np.int32)
+    best = int(y.argmax())
+
+    ax.bar(x, y, color='YellowGreen')
+    ax.bar(best + 1, y[best], color='IndianRed')
+    ax.set_xlabel('Power Curve')
+    ax.set_ylabel('Cumulative Power [Wh]')
+    ax.set_title('Cumulative Power Performance')
+    _style(ax)
+    return
+
+
+def _power_curves_continuous(ax: plt.Axes, cumulated_power: np.array):
+    """
+    Function that draws the cumulative power performance for each rated speed as a line.
+    :param ax: Axes where the line is drawn.
+    :param cumulated_power: cumulative power performance for the rated speeds.
+    :return: None
+    """
+    y = np.ascontiguousarray(cumulated_power, dtype=np.float32)
+    ax.plot(np.arange(0.6, 3.1, 0.1), y/5, marker='o', color='YellowGreen', markersize=10)
+    ax.set_xlabel('Velocidad nominal [m/s]')
+    ax.set_ylabel('Potencia acumulada [Wh/año]')
+    ax.set_title('Potencial energético')
+    _style(ax)
+    return
+
+
+def _style(ax):
+    """
+    Function that applies the lighter minor grid on top of the rcParams grid defaults.
+    :param ax: Axes to style.
+    :return: None
+    """
+    ax.grid(which='minor', alpha=0.10)
+    return
+
+
+def _show(fig: plt.Figure, show: bool):
+    """
+    Function that displays a saved figure until its window is closed, or closes it without displaying it.
+    :param fig: Figure to display.
+    :param show: Indicates if the figure is displayed.
+    :return: None
+    """
+    if show:
+        plt.show(block=True)
+    else:
+        plt.close(fig)
     return